@@ -106,7 +106,7 @@ def compute_layers(gates, layer0_labels):
             continue
 
         # Layer is one more than the max of inputs
-        layers[label] = max(layer_a, layer_b) + 1
+        layers[label] = (layer_a if layer_a > layer_b else layer_b) + 1
 
     # Count gates per layer (excluding layer 0 which is inputs/constants)
     layer_counts = defaultdict(int)
@@ -30,6 +30,7 @@ Usage:
 
 import argparse
 import sys
+from itertools import islice
 
 
 # Constants for three-valued logic
@@ -37,6 +38,11 @@ FALSE = 0
 TRUE = 1
 UNKNOWN = 'X'
 
+# Fixed label ids of the constant wires, indexed by their value
+CONST_0 = 0
+CONST_1 = 1
+CONST_IDS = (CONST_0, CONST_1)
+
 
 def count_gates(filename):
     """Count NAND gates in a circuit file."""
@@ -44,24 +50,64 @@ def count_gates(filename):
         return sum(1 for line in f if line.strip())
 
 
+class Interner:
+    """Two-way mapping between label strings and small integer ids.
+
+    The passes work on ids only: hashing and comparing an int is much cheaper
+    than a label string. CONST-0 and CONST-1 always get ids 0 and 1.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.intern('CONST-0')
+        self.intern('CONST-1')
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        """Return the id for name, allocating a new one if needed."""
+        label_id = self.ids.get(name)
+        if label_id is None:
+            label_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return label_id
+
+
+# Global label table - every label seen by the optimizer maps to an id here
+_labels = Interner()
+
+
+def get_labels():
+    """Get the global label table."""
+    return _labels
+
+
 def load_circuit(filename):
-    """Load NAND circuit."""
+    """Load NAND circuit as (label, a, b) tuples of label ids."""
+    labels = get_labels()
+    ids = labels.ids
+    add = ids.setdefault
     gates = []
+    append = gates.append
     with open(filename, 'r') as f:
         for line in f:
-            line = line.strip()
-            if line:
-                parts = line.split(',')
-                if len(parts) == 3:
-                    gates.append((parts[0], parts[1], parts[2]))
+            parts = line.strip().split(',')
+            if len(parts) == 3:
+                label, a, b = parts
+                append((add(label, len(ids)), add(a, len(ids)), add(b, len(ids))))
+    # Ids are handed out in dict insertion order, so the new names are
+    # exactly the tail of ids.
+    labels.names.extend(islice(ids, len(labels.names), None))
     return gates
 
 
 def save_circuit(filename, gates):
-    """Save NAND circuit."""
-    with open(filename, 'w') as f:
-        for label, a, b in gates:
-            f.write(f"{label},{a},{b}\n")
+    """Save NAND circuit, mapping label ids back to their names."""
+    names = get_labels().names
+    with open(filename, 'w', buffering=1 << 20) as f:
+        f.writelines(f"{names[label]},{names[a]},{names[b]}\n" for label, a, b in gates)
 
 
 def load_outputs(filepath):
@@ -79,7 +125,7 @@ def load_outputs(filepath):
     return outputs
 
 
-# Global outputs set - loaded once at startup, used by optimization passes
+# Global outputs set (label ids) - loaded once at startup, used by optimization passes
 _outputs = set()
 
 
@@ -94,6 +140,93 @@ def get_outputs():
     return _outputs
 
 
+# Most recent gate list and the structures derived from it. Passes return
+# their input list unchanged when they find nothing, so consecutive passes
+# can share one copy of each structure.
+_derived_cache = (None, {})
+
+
+def get_derived(gates, name, build):
+    """Get build(gates), reusing the result computed for the same list."""
+    global _derived_cache
+    cached_gates, derived = _derived_cache
+    if cached_gates is not gates:
+        derived = {}
+        _derived_cache = (gates, derived)
+    if name not in derived:
+        derived[name] = build(gates)
+    return derived[name]
+
+
+def get_gate_map(gates):
+    """Get {label: (a, b)} for gates."""
+    return get_derived(gates, 'gate_map',
+                       lambda gates: {label: (a, b) for label, a, b in gates})
+
+
+def build_not_map(gates):
+    """Map each NOT gate, NAND(x, x) or NAND(x, CONST-1), to x."""
+    not_map = {}
+    for label, a, b in gates:
+        if a == b:
+            not_map[label] = a
+        elif a == CONST_1:
+            not_map[label] = b
+        elif b == CONST_1:
+            not_map[label] = a
+    return not_map
+
+
+def get_not_map(gates):
+    """Get {label: x} for every NOT gate in gates."""
+    return get_derived(gates, 'not_map', build_not_map)
+
+
+def build_xor_map(gates):
+    """Map each label computing XOR(a, b) with the 4-NAND pattern to (a, b).
+
+    XOR(a, b) = NAND(NAND(a, t), NAND(b, t)) with t = NAND(a, b).
+    """
+    gate_map = get_gate_map(gates)
+    get = gate_map.get
+    xor_map = {}
+    for label, (x, y) in gate_map.items():
+        x_inputs = get(x)
+        if x_inputs is None:
+            continue
+        y_inputs = get(y)
+        if y_inputs is None:
+            continue
+
+        x_a, x_b = x_inputs
+        y_a, y_b = y_inputs
+
+        if x_b == y_b:
+            t, a, b = x_b, x_a, y_a
+        elif x_b == y_a:
+            t, a, b = x_b, x_a, y_b
+        elif x_a == y_b:
+            t, a, b = x_a, x_b, y_a
+        elif x_a == y_a:
+            t, a, b = x_a, x_b, y_b
+        else:
+            continue
+
+        t_inputs = get(t)
+        if t_inputs is None:
+            continue
+
+        t_a, t_b = t_inputs
+        if (t_a == a and t_b == b) or (t_a == b and t_b == a):
+            xor_map[label] = (a, b)
+    return xor_map
+
+
+def get_xor_map(gates):
+    """Get {label: (a, b)} for every recognized XOR in gates."""
+    return get_derived(gates, 'xor_map', build_xor_map)
+
+
 def parse_value(value_str):
     """Parse a value string to 0, 1, or 'X'."""
     value_str = value_str.strip().upper()
@@ -129,36 +262,105 @@ def nand3(a, b):
 
 # ============== OPTIMIZATION PASSES ==============
 
+def apply_replacements(gates, replacements):
+    """Drop replaced gates and rewire their fanout to the replacements.
+
+    replacements maps a label to the label that supersedes it. Each chain is
+    followed to its end once and then compressed so later lookups are a
+    single step. Passes only point a gate at an earlier wire, but a circuit
+    with duplicate labels can still produce a cycle; those stop at the first
+    repeated label and are left uncompressed. With nothing to replace, gates
+    is returned as is.
+    """
+    if not replacements:
+        return gates
+
+    limit = len(replacements)
+
+    def resolve_cycle(label):
+        seen = set()
+        while label in replacements and label not in seen:
+            seen.add(label)
+            label = replacements[label]
+        return label
+
+    def resolve(label):
+        root = label
+        steps = 0
+        while root in replacements:
+            root = replacements[root]
+            steps += 1
+            if steps > limit:
+                return resolve_cycle(label)
+        while label != root:
+            replacements[label], label = root, replacements[label]
+        return root
+
+    # Most gates are untouched; keep their existing tuples.
+    optimized = []
+    append = optimized.append
+    for gate in gates:
+        label, a, b = gate
+        if label in replacements:
+            continue
+        if a in replacements or b in replacements:
+            append((label, resolve(a), resolve(b)))
+        else:
+            append(gate)
+
+    return optimized
+
+
 def optimize_cse(gates):
     """Common Subexpression Elimination."""
     outputs = get_outputs()
     seen = {}
     replacements = {}
+    get = replacements.get
     optimized = []
-
-    for label, a, b in gates:
-        a_new = replacements.get(a, a)
-        b_new = replacements.get(b, b)
-        key = (min(a_new, b_new), max(a_new, b_new))
-
-        if key in seen and label not in outputs:
-            replacements[label] = seen[key]
+    append = optimized.append
+
+    # Every replacement target is a gate that was kept, so a single lookup
+    # always reaches the canonical label; no chain walking is needed. The
+    # unordered input pair is packed into one int key, which hashes faster
+    # than a tuple and needs no allocation beyond the int itself.
+    for gate in gates:
+        label, a, b = gate
+        a_new = get(a, a)
+        b_new = get(b, b)
+        key = (a_new << 32 | b_new) if a_new < b_new else (b_new << 32 | a_new)
+        canonical = seen.get(key)
+
+        if canonical is not None and label not in outputs:
+            replacements[label] = canonical
         else:
-            if key not in seen:
+            if canonical is None:
                 seen[key] = label
-            optimized.append((label, a_new, b_new))
+            if a_new == a and b_new == b:
+                append(gate)
+            else:
+                append((label, a_new, b_new))
 
+    if not replacements:
+        return gates
     return optimized
 
 
 def optimize_constant_folding(gates, const_values):
-    """Fold constant expressions and propagate constant values."""
-    known = dict(const_values)
+    """Fold constant expressions and propagate constant values.
+
+    Values are tracked in a flat list indexed by label id: FALSE, TRUE or
+    UNKNOWN for wires with a value, None for everything else.
+    """
+    known = [None] * len(get_labels())
+    for label, value in const_values.items():
+        known[label] = value
     first_pass = []
 
-    for label, a, b in gates:
-        a_val = known.get(a)
-        b_val = known.get(b)
+    for gate in gates:
+        label, a, b = gate
+        a_val = known[a]
+        b_val = known[b]
 
         if a_val == FALSE or b_val == FALSE:
             known[label] = TRUE
@@ -166,35 +368,105 @@ def optimize_constant_folding(gates, const_values):
             if a_val == TRUE and b_val == TRUE:
                 known[label] = FALSE
             elif a_val == UNKNOWN or b_val == UNKNOWN:
-                first_pass.append((label, a, b))
+                first_pass.append(gate)
             else:
                 known[label] = nand3(a_val, b_val)
         else:
-            first_pass.append((label, a, b))
+            first_pass.append(gate)
 
     optimized = []
-    for label, a, b in first_pass:
-        a_new = a
-        b_new = b
+    changed = len(first_pass) != len(gates)
+    for gate in first_pass:
+        label, a, b = gate
+        a_val = known[a]
+        b_val = known[b]
+        if (a_val is None or a_val == UNKNOWN) and (b_val is None or b_val == UNKNOWN):
+            optimized.append(gate)
+            continue
 
-        if a in known and known[a] != UNKNOWN:
-            a_new = f"CONST-{known[a]}"
-        if b in known and known[b] != UNKNOWN:
-            b_new = f"CONST-{known[b]}"
+        if a_val is not None and a_val != UNKNOWN:
+            a = CONST_IDS[a_val]
+        if b_val is not None and b_val != UNKNOWN:
+            b = CONST_IDS[b_val]
 
-        optimized.append((label, a_new, b_new))
+        if (a, b) == gate[1:]:
+            optimized.append(gate)
+        else:
+            optimized.append((label, a, b))
+            changed = True
 
+    if not changed:
+        return gates, known
     return optimized, known
 
 
+def topological_order(gates):
+    """Return gates ordered so every gate follows the gates driving it.
+
+    Circuit files are normally written in this order already, in which case
+    gates is returned unchanged. Several passes (dead code elimination in
+    particular) rely on it. Raises ValueError if the circuit has a loop, or
+    if it needs reordering and defines a label more than once, since which
+    definition a gate reads is then ambiguous.
+    """
+    n = len(get_labels())
+    is_gate = bytearray(n)
+    for label, _, _ in gates:
+        is_gate[label] = 1
+
+    defined = bytearray(n)
+    for label, a, b in gates:
+        if (is_gate[a] and not defined[a]) or (is_gate[b] and not defined[b]):
+            break
+        defined[label] = 1
+    else:
+        return gates
+
+    # Depth-first: emit each gate after everything it depends on, visiting
+    # roots in file order. state is 0 = unvisited, 1 = in progress, 2 = done.
+    gate_map = {label: (a, b) for label, a, b in gates}
+    if len(gate_map) != len(gates):
+        seen = bytearray(n)
+        for label, _, _ in gates:
+            if seen[label]:
+                raise ValueError(f"Gates are out of order and {get_labels().names[label]} "
+                                 f"is defined more than once")
+            seen[label] = 1
+    state = bytearray(n)
+    ordered = []
+    for root, _, _ in gates:
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(gate_map[root]))]
+        while stack:
+            label, inputs = stack[-1]
+            for x in inputs:
+                if x in gate_map:
+                    if state[x] == 1:
+                        raise ValueError(f"Circuit has a loop through {get_labels().names[x]}")
+                    if state[x] == 0:
+                        state[x] = 1
+                        stack.append((x, iter(gate_map[x])))
+                        break
+            else:
+                stack.pop()
+                state[label] = 2
+                ordered.append((label,) + gate_map[label])
+    return ordered
+
+
 def rename_outputs(gates):
     """Rename FINAL-H*-ADD-B* labels to OUTPUT-W*-B* format."""
     import re
     pattern = re.compile(r'^FINAL-H(\d+)-ADD-B(\d+)$')
 
+    # Match against the label table, where each name appears once, rather
+    # than against every gate.
+    labels = get_labels()
     renames = {}
-    for label, a, b in gates:
-        m = pattern.match(label)
+    for label, name in enumerate(labels.names):
+        m = pattern.match(name)
         if m:
             word = int(m.group(1))
             bit = int(m.group(2))
@@ -203,193 +475,82 @@ def rename_outputs(gates):
     if not renames:
         return gates
 
-    def resolve(label):
-        return renames.get(label, label)
-
-    return [(resolve(label), resolve(a), resolve(b)) for label, a, b in gates]
+    renames = {label: labels.intern(name) for label, name in renames.items()}
+    get = renames.get
+    return [(get(label, label), get(a, a), get(b, b)) for label, a, b in gates]
 
 
 def optimize_dead_code(gates):
-    """Remove gates not needed for outputs."""
-    outputs = get_outputs()
-    gate_map = {label: (a, b) for label, a, b in gates}
+    """Remove gates not needed for outputs.
 
-    needed = set(outputs)
-    stack = list(outputs)
+    Gates are in topological order, so one backward sweep marks every wire
+    the outputs depend on: by the time a gate is reached, all of its users
+    have already been seen.
+    """
+    needed = bytearray(len(get_labels()))
+    for label in get_outputs():
+        needed[label] = 1
 
-    while stack:
-        label = stack.pop()
-        if label not in gate_map:
-            continue
-        a, b = gate_map[label]
-        for inp in [a, b]:
-            if inp not in needed and inp in gate_map:
-                needed.add(inp)
-                stack.append(inp)
+    for label, a, b in reversed(gates):
+        if needed[label]:
+            needed[a] = 1
+            needed[b] = 1
 
-    return [(label, a, b) for label, a, b in gates if label in needed]
+    optimized = [gate for gate in gates if needed[gate[0]]]
+    if len(optimized) == len(gates):
+        return gates
+    return optimized
 
 
 def optimize_identity_patterns(gates):
     """Remove NOT(NOT(x)) = x patterns."""
     outputs = get_outputs()
-    gate_map = {label: (a, b) for label, a, b in gates}
-    replacements = {}
 
+    # Classify every gate once: not_of[label] = x for each NAND(x, CONST-1).
+    # A NOT(NOT(x)) is then any entry whose input is itself in the table.
+    not_of = {}
     for label, a, b in gates:
-        inner = None
-        if a == 'CONST-1' and b != 'CONST-1':
-            inner = b
-        elif b == 'CONST-1' and a != 'CONST-1':
-            inner = a
-        else:
-            continue
-
-        if inner not in gate_map:
-            continue
-
-        inner_a, inner_b = gate_map[inner]
-        x = None
-        if inner_a == 'CONST-1' and inner_b != 'CONST-1':
-            x = inner_b
-        elif inner_b == 'CONST-1' and inner_a != 'CONST-1':
-            x = inner_a
-        else:
-            continue
+        if a == CONST_1:
+            if b != CONST_1:
+                not_of[label] = b
+        elif b == CONST_1:
+            not_of[label] = a
 
-        if label not in outputs:
+    replacements = {}
+    for label, inner in not_of.items():
+        x = not_of.get(inner)
+        if x is not None and label not in outputs:
+            # x is defined before inner, which is defined before label, so
+            # replacement chains always point backwards and cannot cycle.
+            assert x != label
             replacements[label] = x
 
-    if not replacements:
-        return gates
-
-    def resolve(label):
-        seen = set()
-        while label in replacements:
-            if label in seen:
-                break
-            seen.add(label)
-            label = replacements[label]
-        return label
-
-    optimized = []
-    for label, a, b in gates:
-        if label in replacements:
-            continue
-        optimized.append((label, resolve(a), resolve(b)))
-
-    return optimized
+    return apply_replacements(gates, replacements)
 
 
 def optimize_xor_with_zero(gates):
     """Optimize XOR(x, 0) = x patterns."""
     outputs = get_outputs()
-    gate_map = {label: (a, b) for label, a, b in gates}
-
-    def identify_xor(label):
-        if label not in gate_map:
-            return None
-        x, y = gate_map[label]
-        if x not in gate_map or y not in gate_map:
-            return None
-
-        x_a, x_b = gate_map[x]
-        y_a, y_b = gate_map[y]
-
-        t, a, b = None, None, None
-        if x_b == y_b:
-            t, a, b = x_b, x_a, y_a
-        elif x_b == y_a:
-            t, a, b = x_b, x_a, y_b
-        elif x_a == y_b:
-            t, a, b = x_a, x_b, y_a
-        elif x_a == y_a:
-            t, a, b = x_a, x_b, y_b
-        else:
-            return None
-
-        if t not in gate_map:
-            return None
-
-        t_a, t_b = gate_map[t]
-        if {t_a, t_b} == {a, b}:
-            return (a, b)
-        return None
 
     replacements = {}
-    for label, _, _ in gates:
-        xor_inputs = identify_xor(label)
-        if xor_inputs:
-            a, b = xor_inputs
-            if a == 'CONST-0' and label not in outputs:
-                replacements[label] = b
-            elif b == 'CONST-0' and label not in outputs:
-                replacements[label] = a
+    for label, (a, b) in get_xor_map(gates).items():
+        if a == CONST_0 and label not in outputs:
+            replacements[label] = b
+        elif b == CONST_0 and label not in outputs:
+            replacements[label] = a
 
-    if not replacements:
-        return gates
-
-    def resolve(label):
-        seen = set()
-        while label in replacements:
-            if label in seen:
-                break
-            seen.add(label)
-            label = replacements[label]
-        return label
-
-    optimized = []
-    for label, a, b in gates:
-        if label in replacements:
-            continue
-        optimized.append((label, resolve(a), resolve(b)))
-
-    return optimized
+    return apply_replacements(gates, replacements)
 
 
 def optimize_xor_with_one(gates):
     """Optimize XOR(x, CONST-1) = NOT(x) patterns."""
-    gate_map = {label: (a, b) for label, a, b in gates}
-
-    def identify_xor(label):
-        if label not in gate_map:
-            return None
-        x, y = gate_map[label]
-        if x not in gate_map or y not in gate_map:
-            return None
-
-        x_a, x_b = gate_map[x]
-        y_a, y_b = gate_map[y]
-
-        t, a, b = None, None, None
-        if x_b == y_b:
-            t, a, b = x_b, x_a, y_a
-        elif x_b == y_a:
-            t, a, b = x_b, x_a, y_b
-        elif x_a == y_b:
-            t, a, b = x_a, x_b, y_a
-        elif x_a == y_a:
-            t, a, b = x_a, x_b, y_b
-        else:
-            return None
-
-        if t not in gate_map:
-            return None
-
-        t_a, t_b = gate_map[t]
-        if {t_a, t_b} == {a, b}:
-            return (a, b, [t, x, y])
-        return None
-
+    labels = get_labels()
     xor_replacements = {}
-    for label, _, _ in gates:
-        result = identify_xor(label)
-        if result:
-            a, b, _ = result
-            if a == 'CONST-1':
-                xor_replacements[label] = (b, f"{label}-NOT")
-            elif b == 'CONST-1':
-                xor_replacements[label] = (a, f"{label}-NOT")
+    for label, (a, b) in get_xor_map(gates).items():
+        if a == CONST_1:
+            xor_replacements[label] = (b, labels.intern(f"{labels.names[label]}-NOT"))
+        elif b == CONST_1:
+            xor_replacements[label] = (a, labels.intern(f"{labels.names[label]}-NOT"))
 
     if not xor_replacements:
         return gates
@@ -414,13 +575,8 @@ def optimize_share_inverters(gates):
     """Share NOT gates computing the same thing."""
     outputs = get_outputs()
     not_of = {}
-    for label, a, b in gates:
-        if a == b:
-            not_of.setdefault(a, []).append(label)
-        elif a == 'CONST-1':
-            not_of.setdefault(b, []).append(label)
-        elif b == 'CONST-1':
-            not_of.setdefault(a, []).append(label)
+    for label, x in get_not_map(gates).items():
+        not_of.setdefault(x, []).append(label)
 
     replacements = {}
     for input_sig, labels in not_of.items():
@@ -437,109 +593,51 @@ def optimize_share_inverters(gates):
                 if other != canonical and other not in outputs:
                     replacements[other] = canonical
 
-    if not replacements:
-        return gates
-
-    def resolve(label):
-        seen = set()
-        while label in replacements:
-            if label in seen:
-                break
-            seen.add(label)
-            label = replacements[label]
-        return label
-
-    optimized = []
-    for label, a, b in gates:
-        if label in replacements:
-            continue
-        optimized.append((label, resolve(a), resolve(b)))
-
-    return optimized
+    return apply_replacements(gates, replacements)
 
 
 def optimize_algebraic(gates):
     """Apply algebraic simplifications: NAND(x, NOT(x)) = 1."""
     outputs = get_outputs()
-    gate_map = {label: (a, b) for label, a, b in gates}
-
-    not_of = {}
-    for label, a, b in gates:
-        if a == b:
-            not_of[label] = a
-        elif a == 'CONST-1':
-            not_of[label] = b
-        elif b == 'CONST-1':
-            not_of[label] = a
+    not_of = get_not_map(gates)
 
     replacements = {}
     for label, a, b in gates:
         if a in not_of and not_of[a] == b:
             if label not in outputs:
-                replacements[label] = 'CONST-1'
+                replacements[label] = CONST_1
         elif b in not_of and not_of[b] == a:
             if label not in outputs:
-                replacements[label] = 'CONST-1'
+                replacements[label] = CONST_1
 
-    if not replacements:
-        return gates
-
-    def resolve(label):
-        seen = set()
-        while label in replacements:
-            if label in seen:
-                break
-            seen.add(label)
-            label = replacements[label]
-        return label
-
-    optimized = []
-    for label, a, b in gates:
-        if label in replacements:
-            continue
-        optimized.append((label, resolve(a), resolve(b)))
-
-    return optimized
+    return apply_replacements(gates, replacements)
 
 
 def optimize_and_simplification(gates):
     """Optimize AND(x, x) = x patterns."""
     outputs = get_outputs()
-    gate_map = {label: (a, b) for label, a, b in gates}
+
+    # Only the inputs of NAND(x, x) gates are ever looked up, so index just
+    # those instead of building a map of every gate.
+    candidates = [(label, a) for label, a, b in gates if a == b]
+    inner_labels = {a for _, a in candidates}
+    inner_map = {label: (a, b) for label, a, b in gates if label in inner_labels}
 
     replacements = {}
-    for label, a, b in gates:
-        if a == b and a in gate_map:
-            inner_a, inner_b = gate_map[a]
+    for label, a in candidates:
+        if a in inner_map:
+            inner_a, inner_b = inner_map[a]
             if inner_a == inner_b:
                 if label not in outputs:
                     replacements[label] = inner_a
 
-    if not replacements:
-        return gates
-
-    def resolve(label):
-        seen = set()
-        while label in replacements:
-            if label in seen:
-                break
-            seen.add(label)
-            label = replacements[label]
-        return label
-
-    optimized = []
-    for label, a, b in gates:
-        if label in replacements:
-            continue
-        optimized.append((label, resolve(a), resolve(b)))
-
-    return optimized
+    return apply_replacements(gates, replacements)
 
 
 def optimize_or_simplification(gates):
     """Recognize OR gates and simplify OR(x, x) = x."""
     outputs = get_outputs()
-    gate_map = {label: (a, b) for label, a, b in gates}
+    gate_map = get_gate_map(gates)
 
     replacements = {}
     for label, a, b in gates:
@@ -552,120 +650,30 @@ def optimize_or_simplification(gates):
                     if label not in outputs:
                         replacements[label] = a_inner_a
 
-    if not replacements:
-        return gates
-
-    def resolve(label):
-        seen = set()
-        while label in replacements:
-            if label in seen:
-                break
-            seen.add(label)
-            label = replacements[label]
-        return label
-
-    optimized = []
-    for label, a, b in gates:
-        if label in replacements:
-            continue
-        optimized.append((label, resolve(a), resolve(b)))
-
-    return optimized
+    return apply_replacements(gates, replacements)
 
 
 def optimize_double_not(gates):
     """More aggressive double negation elimination."""
     outputs = get_outputs()
-    gate_map = {label: (a, b) for label, a, b in gates}
 
-    not_gates = {}
-    for label, a, b in gates:
-        if a == b:
-            not_gates[label] = a
-        elif a == 'CONST-1':
-            not_gates[label] = b
-        elif b == 'CONST-1':
-            not_gates[label] = a
+    not_gates = get_not_map(gates)
 
     replacements = {}
-    for label, a, b in gates:
-        inner = None
-        if a == b:
-            inner = a
-        elif a == 'CONST-1':
-            inner = b
-        elif b == 'CONST-1':
-            inner = a
-
-        if inner and inner in not_gates:
-            original = not_gates[inner]
-            if label not in outputs:
-                replacements[label] = original
-
-    if not replacements:
-        return gates
-
-    def resolve(label):
-        seen = set()
-        while label in replacements:
-            if label in seen:
-                break
-            seen.add(label)
-            label = replacements[label]
-        return label
-
-    optimized = []
-    for label, a, b in gates:
-        if label in replacements:
-            continue
-        optimized.append((label, resolve(a), resolve(b)))
+    for label, inner in not_gates.items():
+        if inner in not_gates and label not in outputs:
+            replacements[label] = not_gates[inner]
 
-    return optimized
+    return apply_replacements(gates, replacements)
 
 
 def optimize_xor_chain(gates):
     """Recognize and deduplicate XOR patterns."""
     outputs = get_outputs()
-    gate_map = {label: (a, b) for label, a, b in gates}
-
-    def identify_xor(label):
-        if label not in gate_map:
-            return None
-        x, y = gate_map[label]
-        if x not in gate_map or y not in gate_map:
-            return None
-
-        x_a, x_b = gate_map[x]
-        y_a, y_b = gate_map[y]
-
-        t, a, b = None, None, None
-        if x_b == y_b:
-            t, a, b = x_b, x_a, y_a
-        elif x_b == y_a:
-            t, a, b = x_b, x_a, y_b
-        elif x_a == y_b:
-            t, a, b = x_a, x_b, y_a
-        elif x_a == y_a:
-            t, a, b = x_a, x_b, y_b
-        else:
-            return None
-
-        if t not in gate_map:
-            return None
-
-        t_a, t_b = gate_map[t]
-        if {t_a, t_b} == {a, b}:
-            return (min(a, b), max(a, b))
-        return None
-
-    xor_outputs = {}
-    for label, _, _ in gates:
-        xor_inputs = identify_xor(label)
-        if xor_inputs:
-            xor_outputs[label] = xor_inputs
 
     xor_by_inputs = {}
-    for label, inputs in xor_outputs.items():
+    for label, (a, b) in get_xor_map(gates).items():
+        inputs = (a, b) if a < b else (b, a)
         xor_by_inputs.setdefault(inputs, []).append(label)
 
     replacements = {}
@@ -683,41 +691,15 @@ def optimize_xor_chain(gates):
                 if other != canonical and other not in outputs:
                     replacements[other] = canonical
 
-    if not replacements:
-        return gates
-
-    def resolve(label):
-        seen = set()
-        while label in replacements:
-            if label in seen:
-                break
-            seen.add(label)
-            label = replacements[label]
-        return label
-
-    optimized = []
-    for label, a, b in gates:
-        if label in replacements:
-            continue
-        optimized.append((label, resolve(a), resolve(b)))
-
-    return optimized
+    return apply_replacements(gates, replacements)
 
 
 def optimize_nand_to_identity(gates):
     """Merge equivalent NOT gates."""
     outputs = get_outputs()
-    not_of = {}
-    for label, a, b in gates:
-        if a == b:
-            not_of[label] = a
-        elif a == 'CONST-1':
-            not_of[label] = b
-        elif b == 'CONST-1':
-            not_of[label] = a
 
     inverts = {}
-    for label, inv_of in not_of.items():
+    for label, inv_of in get_not_map(gates).items():
         inverts.setdefault(inv_of, []).append(label)
 
     replacements = {}
@@ -735,75 +717,73 @@ def optimize_nand_to_identity(gates):
                 if other != canonical and other not in outputs:
                     replacements[other] = canonical
 
-    if not replacements:
-        return gates
-
-    def resolve(label):
-        seen = set()
-        while label in replacements:
-            if label in seen:
-                break
-            seen.add(label)
-            label = replacements[label]
-        return label
-
-    optimized = []
-    for label, a, b in gates:
-        if label in replacements:
-            continue
-        optimized.append((label, resolve(a), resolve(b)))
-
-    return optimized
+    return apply_replacements(gates, replacements)
 
 
 def optimize_cleanup_copies(gates):
     """Remove unnecessary copy operations."""
     outputs = get_outputs()
-    gate_map = {label: (a, b) for label, a, b in gates}
-
-    use_count = {}
-    for label, a, b in gates:
-        use_count[a] = use_count.get(a, 0) + 1
-        use_count[b] = use_count.get(b, 0) + 1
 
     not_gates = {}
     for label, a, b in gates:
         if a == b:
             not_gates[label] = a
 
-    replacements = {}
+    candidates = [(label, a) for label, a, b in gates if a == b and a in not_gates]
+    if not candidates:
+        return gates
+
+    # Use counts are only needed once there is something to check, and are
+    # kept in a flat list indexed by label id.
+    use_count = [0] * len(get_labels())
     for label, a, b in gates:
-        if a == b and a in not_gates:
-            original = not_gates[a]
-            intermediate = a
-            if use_count.get(intermediate, 0) == 1:
-                if label not in outputs:
-                    replacements[label] = original
+        use_count[a] += 1
+        use_count[b] += 1
 
-    if not replacements:
-        return gates
+    replacements = {}
+    for label, intermediate in candidates:
+        if use_count[intermediate] == 1:
+            if label not in outputs:
+                replacements[label] = not_gates[intermediate]
 
-    def resolve(label):
-        seen = set()
-        while label in replacements:
-            if label in seen:
-                break
-            seen.add(label)
-            label = replacements[label]
-        return label
+    return apply_replacements(gates, replacements)
 
-    optimized = []
-    for label, a, b in gates:
-        if label in replacements:
-            continue
-        optimized.append((label, resolve(a), resolve(b)))
 
-    return optimized
+class PassCache:
+    """Track which passes are known to have nothing left to do.
+
+    Every pass is a deterministic function of the gate list, so a pass that
+    left the gates unchanged cannot find anything new until some other pass
+    changes them. Each change bumps version; a pass is skipped while the
+    version it last came up empty on is still current. An idempotent pass
+    has nothing left to do right after it changes the gates, so it is also
+    clean at the version its own change created.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.clean_at = {}
+
+    def is_clean(self, optimize_func):
+        return self.clean_at.get(optimize_func) == self.version
 
+    def record(self, optimize_func, before, after, idempotent=False):
+        if after != before:
+            self.version += 1
+            if not idempotent:
+                return
+        self.clean_at[optimize_func] = self.version
 
-def run_optimization_pass(gates, const_values, pass_name, optimize_func, *args):
+
+def run_optimization_pass(gates, const_values, pass_name, optimize_func, *args, cache=None,
+                          idempotent=False):
     """Run a single optimization pass and report results."""
+    if cache is not None and cache.is_clean(optimize_func):
+        print(f"  {pass_name}: skipped (unchanged since last run)")
+        return gates
+
     before = len(gates)
+    original = gates
 
     if args:
         result = optimize_func(gates, *args)
@@ -814,6 +794,9 @@ def run_optimization_pass(gates, const_values, pass_name, optimize_func, *args):
     else:
         gates = optimize_func(gates)
 
+    if cache is not None:
+        cache.record(optimize_func, original, gates, idempotent)
+
     after = len(gates)
     saved = before - after
 
@@ -825,32 +808,43 @@ def run_optimization_pass(gates, const_values, pass_name, optimize_func, *args):
     return gates
 
 
-def optimize_circuit(gates, const_values, max_iterations=10):
-    """Run all optimization passes iteratively until convergence."""
+def optimize_circuit(gates, const_values, max_iterations=10, min_saved=1):
+    """Run all optimization passes iteratively until convergence.
+
+    Iteration stops once a full iteration saves fewer than min_saved gates.
+    The default of 1 runs until nothing changes.
+    """
     print(f"\nStarting optimization with {len(gates):,} gates")
 
+    ordered = topological_order(gates)
+    if ordered is not gates:
+        print("  Gates were not in dependency order - reordered")
+        gates = ordered
+
     gates = rename_outputs(gates)
+    cache = PassCache()
 
     for iteration in range(1, max_iterations + 1):
         print(f"\n--- Iteration {iteration} ---")
         initial_count = len(gates)
 
-        gates = run_optimization_pass(gates, const_values, "CSE", optimize_cse)
-        gates = run_optimization_pass(gates, const_values, "Share inverters", optimize_share_inverters)
-        gates = run_optimization_pass(gates, const_values, "NAND to identity", optimize_nand_to_identity)
-        gates = run_optimization_pass(gates, const_values, "XOR chain", optimize_xor_chain)
-        gates = run_optimization_pass(gates, const_values, "XOR(0,x)=x", optimize_xor_with_zero)
-        gates = run_optimization_pass(gates, const_values, "XOR(1,x)=NOT(x)", optimize_xor_with_one)
-        gates = run_optimization_pass(gates, const_values, "Algebraic (x NAND !x)", optimize_algebraic)
-        gates, known = optimize_constant_folding(gates, const_values)
-        print(f"  Constant folding: applied")
-        gates = run_optimization_pass(gates, const_values, "Dead code elimination", optimize_dead_code)
-        gates = run_optimization_pass(gates, const_values, "Identity patterns", optimize_identity_patterns)
-        gates = run_optimization_pass(gates, const_values, "Double NOT", optimize_double_not)
-        gates = run_optimization_pass(gates, const_values, "AND(x,x)=x", optimize_and_simplification)
-        gates = run_optimization_pass(gates, const_values, "OR(x,x)=x", optimize_or_simplification)
-        gates = run_optimization_pass(gates, const_values, "Cleanup copies", optimize_cleanup_copies)
-        gates = run_optimization_pass(gates, const_values, "Dead code (cleanup)", optimize_dead_code)
+        gates = run_optimization_pass(gates, const_values, "CSE", optimize_cse, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "Share inverters", optimize_share_inverters, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "NAND to identity", optimize_nand_to_identity, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "XOR chain", optimize_xor_chain, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "XOR(0,x)=x", optimize_xor_with_zero, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "XOR(1,x)=NOT(x)", optimize_xor_with_one, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "Algebraic (x NAND !x)", optimize_algebraic, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "Constant folding", optimize_constant_folding, const_values, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "Dead code elimination", optimize_dead_code, cache=cache,
+                                      idempotent=True)
+        gates = run_optimization_pass(gates, const_values, "Identity patterns", optimize_identity_patterns, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "Double NOT", optimize_double_not, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "AND(x,x)=x", optimize_and_simplification, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "OR(x,x)=x", optimize_or_simplification, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "Cleanup copies", optimize_cleanup_copies, cache=cache)
+        gates = run_optimization_pass(gates, const_values, "Dead code (cleanup)", optimize_dead_code, cache=cache,
+                                      idempotent=True)
 
         final_count = len(gates)
         saved = initial_count - final_count
@@ -860,6 +854,9 @@ def optimize_circuit(gates, const_values, max_iterations=10):
         if saved == 0:
             print("\nConverged - no more improvements possible")
             break
+        if saved < min_saved:
+            print(f"\nStopping - iteration saved fewer than {min_saved:,} gates")
+            break
 
     return gates
 
@@ -874,6 +871,8 @@ def main():
                         help="Results file specifying output labels (default: results-bits.txt)")
     parser.add_argument("--output", "-o", default="nands-optimized-final.txt",
                         help="Output optimized NAND file (default: nands-optimized-final.txt)")
+    parser.add_argument("--min-saved", "-m", type=int, default=1,
+                        help="Stop once an iteration saves fewer than this many gates (default: 1)")
     args = parser.parse_args()
 
     print("=" * 60)
@@ -883,7 +882,8 @@ def main():
     # Load outputs (results specification)
     print(f"\nLoading outputs from {args.results}...")
     outputs = load_outputs(args.results)
-    set_outputs(outputs)
+    labels = get_labels()
+    set_outputs({labels.intern(label) for label in outputs})
     print(f"  Loaded {len(outputs)} output labels")
 
     # Determine input files
@@ -895,6 +895,7 @@ def main():
     # Load inputs (constants)
     print(f"\nLoading constants from {input_files}...")
     const_values = load_inputs(input_files)
+    const_values = {labels.intern(label): value for label, value in const_values.items()}
     print(f"  Loaded {len(const_values)} values")
 
     # Load circuit
@@ -904,7 +905,11 @@ def main():
     print(f"  Loaded {initial_count:,} gates")
 
     # Run optimization
-    gates = optimize_circuit(gates, const_values)
+    try:
+        gates = optimize_circuit(gates, const_values, min_saved=args.min_saved)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
 
     final_count = len(gates)
     total_saved = initial_count - final_count
@@ -23,15 +23,6 @@ TRUE = 1
 UNKNOWN = 'X'
 
 
-def nand3(a, b):
-    """Three-valued NAND operation."""
-    if a == FALSE or b == FALSE:
-        return TRUE
-    if a == TRUE and b == TRUE:
-        return FALSE
-    return UNKNOWN
-
-
 def parse_value(value_str):
     """Parse a value string to 0, 1, or 'X'."""
     value_str = value_str.strip().upper()
@@ -74,41 +65,65 @@ def load_circuit(nands_file, input_files):
     return nodes, gates
 
 
-def evaluate_circuit(nodes, gates, input_bits):
-    """Evaluate circuit with given input bits using three-valued logic."""
-    values = dict(nodes)
+def evaluate_circuit_batch(nodes, gates, input_bits_list):
+    """Evaluate circuit for several sets of input bits in one sweep.
 
-    # Set input bits
-    for label, value in input_bits.items():
-        values[label] = ('const', value)
+    Each wire carries two ints used as bit vectors with one bit (lane) per
+    input set: ones has the lanes where the wire is 1, zeros the lanes where
+    it is 0, and a lane in neither is X. A NAND output is then 1 wherever
+    either input is 0 and 0 wherever both inputs are 1, which is exactly
+    the three-valued NAND applied to every lane at once.
+    """
+    all_lanes = (1 << len(input_bits_list)) - 1
+
+    values = {}
+    for label, (_, value) in nodes.items():
+        if value == TRUE:
+            values[label] = (all_lanes, 0)
+        elif value == FALSE:
+            values[label] = (0, all_lanes)
+        else:
+            values[label] = (0, 0)
 
-    # Evaluate gates using three-valued NAND
+    # Set input bits
+    for label in set().union(*input_bits_list):
+        ones = zeros = 0
+        for lane, input_bits in enumerate(input_bits_list):
+            value = input_bits.get(label)
+            if value is None:
+                value = nodes[label][1]
+            if value == TRUE:
+                ones |= 1 << lane
+            elif value == FALSE:
+                zeros |= 1 << lane
+        values[label] = (ones, zeros)
+
+    # Evaluate gates using three-valued NAND on all lanes
     for label, a, b in gates:
-        a_val = values[a][1] if isinstance(values[a], tuple) else values[a]
-        b_val = values[b][1] if isinstance(values[b], tuple) else values[b]
-        result = nand3(a_val, b_val)
-        values[label] = result
+        a_ones, a_zeros = values[a]
+        b_ones, b_zeros = values[b]
+        values[label] = (a_zeros | b_zeros, a_ones & b_ones)
 
     # Extract output
-    result = []
-    has_unknown = False
-    for word in range(8):
-        value = 0
-        word_unknown_bits = []
-        for bit in range(32):
-            label = f"OUTPUT-W{word}-B{bit}"
-            v = values[label][1] if isinstance(values[label], tuple) else values[label]
-            if v == UNKNOWN:
-                has_unknown = True
-                word_unknown_bits.append(bit)
-            elif v == TRUE:
-                value |= (1 << bit)
-        if word_unknown_bits:
-            result.append(f"{value:08x}[X@{','.join(map(str, word_unknown_bits))}]")
-        else:
-            result.append(f"{value:08x}")
-
-    return ''.join(result)
+    results = []
+    for lane in range(len(input_bits_list)):
+        result = []
+        for word in range(8):
+            value = 0
+            word_unknown_bits = []
+            for bit in range(32):
+                ones, zeros = values[f"OUTPUT-W{word}-B{bit}"]
+                if (ones >> lane) & 1:
+                    value |= (1 << bit)
+                elif not (zeros >> lane) & 1:
+                    word_unknown_bits.append(bit)
+            if word_unknown_bits:
+                result.append(f"{value:08x}[X@{','.join(map(str, word_unknown_bits))}]")
+            else:
+                result.append(f"{value:08x}")
+        results.append(''.join(result))
+
+    return results
 
 
 def generate_input_bits(message_bytes):
@@ -137,23 +152,28 @@ def reference_sha256(message_bytes):
     return hashlib.sha256(message_bytes).hexdigest()
 
 
-def run_test(nodes, gates, message_bytes, verbose=False):
-    """Run a single test and return True if passed."""
-    input_bits = generate_input_bits(message_bytes)
+def run_tests(nodes, gates, messages, verbose=False):
+    """Run all tests in one batched evaluation and return the number passed."""
+    circuit_results = evaluate_circuit_batch(
+        nodes, gates, [generate_input_bits(msg) for msg in messages])
 
-    circuit_result = evaluate_circuit(nodes, gates, input_bits)
-    reference_result = reference_sha256(message_bytes)
+    passed_count = 0
+    for message_bytes, circuit_result in zip(messages, circuit_results):
+        reference_result = reference_sha256(message_bytes)
 
-    passed = circuit_result == reference_result
+        passed = circuit_result == reference_result
 
-    if verbose or not passed:
-        status = "PASS" if passed else "FAIL"
-        print(f"  {status}: message={message_bytes!r}")
-        if not passed:
-            print(f"    Circuit:   {circuit_result}")
-            print(f"    Reference: {reference_result}")
+        if verbose or not passed:
+            status = "PASS" if passed else "FAIL"
+            print(f"  {status}: message={message_bytes!r}")
+            if not passed:
+                print(f"    Circuit:   {circuit_result}")
+                print(f"    Reference: {reference_result}")
 
-    return passed
+        if passed:
+            passed_count += 1
+
+    return passed_count
 
 
 def main():
@@ -194,14 +214,8 @@ def main():
         test_messages.append(msg)
 
     print(f"\nRunning {len(test_messages)} tests...")
-    passed = 0
-    failed = 0
-
-    for msg in test_messages:
-        if run_test(nodes, gates, msg, args.verbose):
-            passed += 1
-        else:
-            failed += 1
+    passed = run_tests(nodes, gates, test_messages, args.verbose)
+    failed = len(test_messages) - passed
 
     print(f"\nResults: {passed} passed, {failed} failed")
 